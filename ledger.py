@@ -1,61 +1,238 @@
-import json
+import asyncio
+import hashlib
 import os
-from typing import Dict, Any, List, Optional
+import time
+from collections import defaultdict
+from itertools import takewhile
+from operator import attrgetter, itemgetter
+from typing import DefaultDict, Dict, Any, List, Optional, Set, Tuple
 
-import requests
+import httpx
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+
+    def _dump_state(state: Dict[str, Any]) -> bytes:
+        return orjson.dumps(state, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS)
+except ImportError:
+    # orjson is a compiled wheel; fall back to ujson, then the stdlib
+    try:
+        import ujson as json
+    except ImportError:
+        import json
+
+    _loads = json.loads
+
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+    def _dump_state(state: Dict[str, Any]) -> bytes:
+        return json.dumps(state, indent=2, sort_keys=True).encode("utf-8")
+
+try:
+    import msgspec
+
+    # Only the fields we print; msgspec skips everything else in players/nfl
+    # without building a dict for it. Sleeper sends null for free agents' team.
+    class _Player(msgspec.Struct, gc=False):
+        full_name: Optional[str] = None
+        position: Optional[str] = None
+        team: Optional[str] = None
+
+    _decode_players = msgspec.json.Decoder(Dict[str, _Player]).decode
+    _player_fields = attrgetter("full_name", "position", "team")
+except ImportError:
+    # msgspec is a compiled wheel too; without it parse players/nfl into dicts
+    _decode_players = _loads
+
+    def _player_fields(p: Dict[str, Any]) -> Tuple[Any, Any, Any]:
+        return p.get("full_name"), p.get("position"), p.get("team")
 
 LEAGUE_ID = os.environ["SLEEPER_LEAGUE_ID"]
 WEBHOOK_WAIVERS = os.environ["DISCORD_WEBHOOK_WAIVERS"]
 WEBHOOK_TRADES = os.environ["DISCORD_WEBHOOK_TRADES"]
 
 STATE_FILE = "state.json"
+CACHE_DIR = ".cache"
+SLEEPER_API = "https://api.sleeper.app/v1"
+LEAGUE_URL = f"{SLEEPER_API}/league/{LEAGUE_ID}"
+PLAYERS_URL = f"{SLEEPER_API}/players/nfl"
+PLAYERS_TTL_S = 24 * 60 * 60
+# League membership and team names change a few times a season at most;
+# past the TTL we revalidate, and a 304 costs a round-trip and no body
+META_TTL_S = 30 * 60
 USER_AGENT = "ironbound-ledger-bot/1.0"
 
-
-def _get(url: str) -> Any:
-    r = requests.get(url, timeout=30, headers={"User-Agent": USER_AGENT})
+# Keep this window small; round 1 is clearly active for you right now.
+ROUNDS = (0, 1, 2, 3)
+# Sleeper may not bump the league's last_transaction_id when a pending trade
+# or claim finalises; the workflow's hourly schedule sets FULL_CHECK=1 so
+# those runs fetch the rounds even when the id hasn't moved
+FULL_CHECK = os.environ.get("FULL_CHECK") == "1"
+# Discord 429s are resent after Retry-After, up to this many tries per message
+POST_ATTEMPTS = 5
+
+_RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+
+class _RetryTransport(httpx.AsyncHTTPTransport):
+    # httpx itself only retries failed connects; also back off on 429/5xx GETs
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        for attempt in range(3):
+            response = await super().handle_async_request(request)
+            if request.method != "GET" or response.status_code not in _RETRY_STATUSES:
+                return response
+            await response.aclose()
+            try:
+                delay = float(response.headers["Retry-After"])
+            except (KeyError, ValueError):
+                delay = 0.3 * 2 ** attempt
+            await asyncio.sleep(delay)
+        return await super().handle_async_request(request)
+
+
+def _new_client() -> httpx.AsyncClient:
+    # One HTTP/2 client for every Sleeper/Discord call: each host gets a single
+    # TLS connection and concurrent requests multiplex over it as streams.
+    # Idle connections outlive httpx's 5 s default so a Discord rate-limit
+    # wait or 429 backoff doesn't cost a fresh handshake.
+    return httpx.AsyncClient(
+        transport=_RetryTransport(
+            http2=True,
+            retries=3,
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=10, keepalive_expiry=30.0),
+        ),
+        timeout=30.0,
+        headers={"User-Agent": USER_AGENT},
+    )
+
+
+async def _get(client: httpx.AsyncClient, url: str) -> Any:
+    r = await client.get(url)
     r.raise_for_status()
-    return r.json()
+    return _loads(r.content)
+
 
+def _cache_path(url: str) -> str:
+    # Keyed on the full URL, so a new season's league id never reuses old files
+    return os.path.join(CACHE_DIR, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".json")
 
-def post(webhook: str, msg: str) -> None:
-    # Discord hard limit is 2000 chars
-    if len(msg) > 1950:
-        msg = msg[:1950] + "…"
-    r = requests.post(webhook, json={"content": msg}, timeout=30)
+
+async def _refresh_cache(client: httpx.AsyncClient, url: str, ttl_s: int) -> str:
+    path = _cache_path(url)
+    # Fresh enough: don't even ask
+    if os.path.exists(path) and time.time() - os.path.getmtime(path) < ttl_s:
+        return path
+
+    meta_path = path + ".meta"
+    headers: Dict[str, str] = {}
+    if os.path.exists(path) and os.path.exists(meta_path):
+        with open(meta_path, "rb") as f:
+            meta = _loads(f.read())
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    try:
+        async with client.stream("GET", url, headers=headers) as r:
+            if r.status_code == 304:
+                os.utime(path)  # unchanged upstream; restart the TTL
+                return path
+            r.raise_for_status()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                async for chunk in r.aiter_bytes():
+                    f.write(chunk)
+            os.replace(tmp, path)
+            meta = {"etag": r.headers.get("ETag"), "last_modified": r.headers.get("Last-Modified")}
+    except httpx.HTTPError as e:
+        # Sleeper down, erroring or still throttling after retries: a stale copy
+        # beats failing the run
+        client_error = (
+            isinstance(e, httpx.HTTPStatusError)
+            and e.response.status_code < 500
+            and e.response.status_code != 429
+        )
+        if client_error or not os.path.exists(path):
+            raise
+        return path
+
+    with open(meta_path, "wb") as f:
+        f.write(_dumps(meta))
+    return path
+
+
+async def _cached_get(client: httpx.AsyncClient, url: str, ttl_s: int) -> Any:
+    with open(await _refresh_cache(client, url, ttl_s), "rb") as f:
+        return _loads(f.read())
+
+
+async def post(client: httpx.AsyncClient, webhook: str, payload: Dict[str, Any]) -> None:
+    # Encode with our JSON backend rather than httpx's stdlib json.dumps
+    body = _dumps(payload)
+    for _ in range(POST_ATTEMPTS):
+        r = await client.post(webhook, content=body, headers={"Content-Type": "application/json"})
+        # A 429 means Discord dropped the message; wait as told and resend
+        # rather than failing the run and losing the receipt
+        if r.status_code != 429:
+            break
+        await asyncio.sleep(float(r.headers.get("Retry-After") or 1))
     r.raise_for_status()
+    # Out of budget for this webhook's bucket; wait it out before the next post
+    if r.headers.get("X-RateLimit-Remaining") == "0":
+        await asyncio.sleep(float(r.headers.get("X-RateLimit-Reset-After") or 1))
+
+
+async def post_all(
+    client: httpx.AsyncClient,
+    webhook: str,
+    msgs: List[Dict[str, Any]],
+    lock: asyncio.Lock,
+) -> None:
+    # One webhook's chunks go out strictly in order, or receipts would interleave;
+    # the lock keeps that true when both channels share one webhook URL
+    async with lock:
+        for msg in msgs:
+            await post(client, webhook, msg)
 
 
 def load_state() -> Dict[str, Any]:
     if not os.path.exists(STATE_FILE):
         return {"last_seen_ms": 0}
-    with open(STATE_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+    with open(STATE_FILE, "rb") as f:
+        return _loads(f.read())
 
 
 def save_state(state: Dict[str, Any]) -> None:
-    with open(STATE_FILE, "w", encoding="utf-8") as f:
-        json.dump(state, f, indent=2, sort_keys=True)
-
-def user_name_map() -> Dict[str, str]:
-    users = _get(f"https://api.sleeper.app/v1/league/{LEAGUE_ID}/users")
-    out: Dict[str, str] = {}
-    for u in users:
-        uid = u.get("user_id")
-        if not uid:
-            continue
-        # prefer team name if they set one; fallback to display_name
-        md = u.get("metadata") or {}
-        name = md.get("team_name") or u.get("display_name") or f"User {uid}"
-        out[str(uid)] = name
-    return out
-
-def fetch_transactions(round_num: int) -> List[Dict[str, Any]]:
-    return _get(f"https://api.sleeper.app/v1/league/{LEAGUE_ID}/transactions/{round_num}")
-
-def roster_name_map():
-    rosters = _get(f"https://api.sleeper.app/v1/league/{LEAGUE_ID}/rosters")
-    umap = user_name_map()
+    # A run killed mid-write must not leave a truncated state.json behind:
+    # a reset watermark would repost every transaction in the window
+    tmp = STATE_FILE + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(_dump_state(state))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, STATE_FILE)
+
+async def user_name_map(client: httpx.AsyncClient) -> Dict[str, str]:
+    users = await _cached_get(client, f"{LEAGUE_URL}/users", META_TTL_S)
+    # prefer team name if they set one; fallback to display_name
+    return {
+        str(uid): (u.get("metadata") or {}).get("team_name") or u.get("display_name") or f"User {uid}"
+        for u in users
+        if (uid := u.get("user_id"))
+    }
+
+async def fetch_transactions(client: httpx.AsyncClient, round_num: int) -> List[Dict[str, Any]]:
+    return await _get(client, f"{LEAGUE_URL}/transactions/{round_num}")
+
+async def roster_name_map(client: httpx.AsyncClient):
+    rosters = await _cached_get(client, f"{LEAGUE_URL}/rosters", META_TTL_S)
+    umap: Optional[Dict[str, str]] = None
 
     rmap: Dict[int, str] = {}
     user_to_rid: Dict[int, int] = {}
@@ -67,73 +244,97 @@ def roster_name_map():
         if rid is None:
             continue
 
-        # name comes from users endpoint, because roster.metadata is None in your league
-        name = umap.get(str(oid), f"Roster {rid}") if oid is not None else f"Roster {rid}"
-        rmap[int(rid)] = name
+        name = (r.get("metadata") or {}).get("team_name")
+        if not name and oid is not None:
+            # roster.metadata is None in your league, so names usually come
+            # from the users endpoint; only fetch it once something needs it
+            if umap is None:
+                umap = await user_name_map(client)
+            name = umap.get(str(oid))
+        rmap[int(rid)] = name or f"Roster {rid}"
 
         if oid is not None:
             user_to_rid[int(oid)] = int(rid)
 
     return rmap, user_to_rid
 
-def player_name_map() -> Dict[str, str]:
-    players = _get("https://api.sleeper.app/v1/players/nfl")
+def player_name_map(path: str, needed: Set[str]) -> Dict[str, str]:
     out: Dict[str, str] = {}
-    for pid, p in players.items():
-        name = (p.get("full_name") or "").strip() or pid
-        pos = (p.get("position") or "").strip()
-        team = (p.get("team") or "").strip()
-        if pos and team:
-            out[pid] = f"{name} ({pos} {team})"
-        elif pos:
-            out[pid] = f"{name} ({pos})"
-        else:
-            out[pid] = name
+    if not needed:
+        return out
+    # players/nfl is several MB and changes at most daily; it's kept on disk
+    # and decoded straight into slim structs where msgspec is available
+    with open(path, "rb") as f:
+        players = _decode_players(f.read())
+    pget = players.get
+    for pid in needed:
+        p = pget(pid)
+        if p is None:
+            continue
+        name, pos, team = ((v or "").strip() for v in _player_fields(p))
+        suffix = f" ({pos} {team})" if pos and team else (f" ({pos})" if pos else "")
+        out[pid] = (name or pid) + suffix
     return out
 
-def resolve_rid(val: Any, rmap: Dict[int, str], user_to_rid: Dict[int, int]) -> Optional[int]:
-    if val is None:
-        return None
+def resolve_rid(val: Any, rid_index: Dict[int, int]) -> Optional[int]:
+    # Some payloads give roster_id, some give user_id; rid_index maps both
     try:
-        x = int(val)
+        return rid_index.get(int(val))
     except (TypeError, ValueError):
         return None
-    if x in rmap:          # already a roster_id
-        return x
-    if x in user_to_rid:   # it's a user_id
-        return user_to_rid[x]
-    return None
-
-def fmt_player(pid: str, pmap: Dict[str, str]) -> str:
-    return pmap.get(pid, pid)
 
-def fmt_pick(p: dict, rmap: dict[int, str]) -> str:
-    season = p.get("season", "?")
-    rnd = p.get("round", "?")
-    orig = p.get("roster_id")  # "original" roster this pick belongs to
-    orig_txt = f" ({rmap.get(orig, f'Roster {orig}')} pick)" if orig is not None else ""
-    return f"{season} - Rd {rnd}{orig_txt}"
-
-def is_final_status(t: Dict[str, Any]) -> bool:
-    status = (t.get("status") or "").lower()
-    return status in ("complete", "approved", "executed")
+_FINAL = frozenset(("complete", "approved", "executed"))
+# Discord caps an embed description at 4096 chars, a message at 10 embeds,
+# and all of one message's embeds at 6000 chars combined; half-size chunks
+# let two full embeds share each post
+_MESSAGE_LIMIT = 6000
+_CHUNK_LIMIT = _MESSAGE_LIMIT // 2
+_EMBEDS_PER_MESSAGE = 10
+_WAIVER_COLOR = 0x2ECC71
+_TRADE_COLOR = 0x3498DB
+_WAIVER_HEADER = "🧾 **Player Transaction**"
+_TRADE_HEADER = "🤝 **Trade Receipt**"
 
 
 def txn_ts(t: Dict[str, Any]) -> int:
     return int(t.get("status_updated") or t.get("created") or 0)
 
 
-def chunk_lines(header: str, lines: List[str]) -> List[str]:
-    msgs = []
-    cur = header
+def chunk_lines(header: str, lines: List[str], _limit: int = _CHUNK_LIMIT) -> List[str]:
+    msgs: List[str] = []
+    buf: List[str] = [header]
+    size = len(header)
     for line in lines:
-        if len(cur) + len(line) + 1 > 1900:
-            msgs.append(cur)
-            cur = header + line + "\n"
-        else:
-            cur += line + "\n"
-    if cur.strip() != header.strip():
-        msgs.append(cur)
+        ln = len(line) + 1
+        # Flush only if this chunk holds something besides the header; an
+        # over-long line goes out alone and build_messages() trims it
+        if size + ln > _limit and len(buf) > 1:
+            msgs.append("".join(buf))
+            buf, size = [header], len(header)
+        buf.append(line)
+        buf.append("\n")
+        size += ln
+    tail = "".join(buf)
+    if tail.strip() != header.strip():
+        msgs.append(tail)
+    return msgs
+
+
+def build_messages(lines: List[str], color: int) -> List[Dict[str, Any]]:
+    # Pack receipts into as few webhook posts as Discord's embed limits allow
+    msgs: List[Dict[str, Any]] = []
+    embeds: List[Dict[str, Any]] = []
+    size = 0
+    for desc in chunk_lines("", lines):
+        if len(desc) > _CHUNK_LIMIT:
+            desc = desc[:_CHUNK_LIMIT - 1] + "…"
+        if embeds and (len(embeds) == _EMBEDS_PER_MESSAGE or size + len(desc) > _MESSAGE_LIMIT):
+            msgs.append({"embeds": embeds})
+            embeds, size = [], 0
+        embeds.append({"description": desc, "color": color})
+        size += len(desc)
+    if embeds:
+        msgs.append({"embeds": embeds})
     return msgs
 
 
@@ -143,25 +344,23 @@ def format_waiver_receipt(t: Dict[str, Any], rmap: Dict[int, str], pmap: Dict[st
     if not adds and not drops:
         return None
 
-    per: Dict[int, Dict[str, List[str]]] = {}
+    pget, rget = pmap.get, rmap.get
+    per_adds: DefaultDict[int, List[str]] = defaultdict(list)
+    per_drops: DefaultDict[int, List[str]] = defaultdict(list)
 
     for pid, rid in adds.items():
-        rid = int(rid)
-        per.setdefault(rid, {"adds": [], "drops": []})
-        per[rid]["adds"].append(fmt_player(pid, pmap))
-
+        per_adds[int(rid)].append(pget(pid, pid))
     for pid, rid in drops.items():
-        rid = int(rid)
-        per.setdefault(rid, {"adds": [], "drops": []})
-        per[rid]["drops"].append(fmt_player(pid, pmap))
+        per_drops[int(rid)].append(pget(pid, pid))
 
-    ts = txn_ts(t)
-    lines: List[str] = [f"🧾 **Player Transaction**"]
+    lines: List[str] = [_WAIVER_HEADER]
 
-    for rid in sorted(per.keys()):
-        team = rmap.get(rid, f"Roster {rid}")
-        adds = per[rid]["adds"]
-        drops = per[rid]["drops"]
+    # Most add/drops touch a single roster; only sort when there's an order to fix
+    rids = per_adds.keys() | per_drops.keys()
+    for rid in (sorted(rids) if len(rids) > 1 else rids):
+        team = rget(rid, f"Roster {rid}")
+        adds = per_adds.get(rid)
+        drops = per_drops.get(rid)
 
         lines.append(f"**{team}**")
 
@@ -188,56 +387,41 @@ def format_trade_receipt(
     t: Dict[str, Any],
     rmap: Dict[int, str],
     pmap: Dict[str, str],
-    user_to_rid: Dict[int, int],
+    rid_index: Dict[int, int],
 ) -> Optional[List[str]]:
 
     adds = t.get("adds") or {}
     draft_picks = t.get("draft_picks") or []
     rosters = t.get("roster_ids") or t.get("consenter_roster_ids") or []
-
-    def resolve_rid(val: Any) -> Optional[int]:
-        if val is None:
-            return None
-        try:
-            x = int(val)
-        except (TypeError, ValueError):
-            return None
-        # Some payloads give roster_id, some give user_id
-        if x in rmap:
-            return x
-        if x in user_to_rid:
-            return user_to_rid[x]
-        return None
+    pget, rget = pmap.get, rmap.get
 
     received: Dict[int, List[str]] = {}
 
     # players
     for pid, dest in adds.items():
-        rid = resolve_rid(dest)
+        rid = resolve_rid(dest, rid_index)
         if rid is None:
             continue
-        received.setdefault(rid, []).append(fmt_player(pid, pmap))
+        received.setdefault(rid, []).append(pget(pid, pid))
 
     # picks
     for pk in draft_picks:
         season = pk.get("season", "?")
         rnd = pk.get("round", "?")
 
-        dest = resolve_rid(pk.get("owner_id") or pk.get("roster_id"))
+        dest = resolve_rid(pk.get("owner_id") or pk.get("roster_id"), rid_index)
         if dest is None:
             continue
 
-        orig = resolve_rid(pk.get("roster_id") or pk.get("previous_owner_id") or pk.get("previous_roster_id"))
-        orig_txt = f" (from {rmap.get(orig, f'Roster {orig}')})" if orig is not None else ""
+        orig = resolve_rid(
+            pk.get("roster_id") or pk.get("previous_owner_id") or pk.get("previous_roster_id"), rid_index
+        )
+        orig_txt = f" (from {rget(orig, f'Roster {orig}')})" if orig is not None else ""
 
         received.setdefault(dest, []).append(f"{season} Rd {rnd} Pick{orig_txt}")
 
     # If Sleeper didn't include both rosters, still try to print what we have
-    roster_list: List[int] = []
-    for rv in rosters:
-        rid = resolve_rid(rv)
-        if rid is not None:
-            roster_list.append(rid)
+    roster_list: List[int] = [rid for rv in rosters if (rid := resolve_rid(rv, rid_index)) is not None]
 
     # Fall back to keys we actually saw if roster_ids missing
     if len(roster_list) < 2:
@@ -246,9 +430,9 @@ def format_trade_receipt(
     if not received or len(roster_list) < 1:
         return None
 
-    lines: List[str] = ["🤝 **Trade Receipt**"]
+    lines: List[str] = [_TRADE_HEADER]
     for rid in roster_list:
-        team = rmap.get(rid, f"Roster {rid}")
+        team = rget(rid, f"Roster {rid}")
         rec = received.get(rid, [])
         rec_txt = ", ".join(rec) if rec else "—"
         lines.append(f"**{team} receives:** {rec_txt}")
@@ -256,68 +440,122 @@ def format_trade_receipt(
     return lines
 
 
-def main():
+async def main():
     state = load_state()
     last_seen = int(state.get("last_seen_ms", 0))
-
-    rmap, user_to_rid = roster_name_map()
-    pmap = player_name_map()
-
-    # Keep this window small; round 1 is clearly active for you right now.
-    rounds_to_check = [0, 1, 2, 3]
-
-    all_txs: List[Dict[str, Any]] = []
-    for r in rounds_to_check:
-        all_txs.extend(fetch_transactions(r))
-
-    # Only new + final
-    new_txs = []
-    newest = last_seen
-
-    for t in all_txs:
-        ts = txn_ts(t)
-        newest = max(newest, ts)
-        if ts > last_seen and is_final_status(t):
-            new_txs.append(t)
-
-    # Advance state first (prevents replay if message posting fails mid-run)
-    if newest > last_seen:
-        state["last_seen_ms"] = newest
-        save_state(state)
-
-    if not new_txs:
-        return
-
-    new_txs.sort(key=txn_ts)
-
-    waiver_lines: List[str] = []
-    trade_lines: List[str] = []
-
-    for t in new_txs:
-        ttype = (t.get("type") or "").lower()
-
-        if ttype in ("waiver", "free_agent", "add_drop"):
-            block = format_waiver_receipt(t, rmap, pmap)
-            if block:
-                if waiver_lines:
-                    waiver_lines.append("")  # spacer between receipts
-                waiver_lines.extend(block)
-
-        elif ttype == "trade":
-            block = format_trade_receipt(t, rmap, pmap, user_to_rid)
-            if block:
-                if trade_lines:
-                    trade_lines.append("")
-                trade_lines.extend(block)
-
-    if waiver_lines:
-        for msg in chunk_lines("", waiver_lines):
-            post(WEBHOOK_WAIVERS, msg)
-
-    if trade_lines:
-        for msg in chunk_lines("", trade_lines):
-            post(WEBHOOK_TRADES, msg)
+    # Ids already posted at exactly last_seen_ms; states from before this was
+    # tracked treat everything at the watermark as posted
+    prev_seen_ids = state.get("last_seen_ids")
+    seen_ids = None if prev_seen_ids is None else set(prev_seen_ids)
+
+    # Left over in older states; dropped with the next save
+    state.pop("round_max_ts", None)
+    state.pop("last_full_check_ms", None)
+
+    async with _new_client() as client:
+        # Cheapest check first: if the league's newest transaction id hasn't
+        # moved since last run, there's nothing new to fetch
+        league = await _get(client, LEAGUE_URL)
+        prev_txn_id = state.get("last_txn_id")
+        last_txn_id = str(league.get("last_transaction_id") or "")
+        if last_txn_id and last_txn_id == prev_txn_id and not FULL_CHECK:
+            return
+        state["last_txn_id"] = last_txn_id
+
+        # Every round, every time: a txn keeps its round when it finalises and
+        # all rounds share one watermark, so a round skipped while the
+        # watermark moves on would lose that receipt for good
+        per_round = await asyncio.gather(*(fetch_transactions(client, r) for r in ROUNDS))
+
+        # Stamp each txn once for the sort and the scan below
+        stamped: List[Tuple[int, Dict[str, Any]]] = [(txn_ts(t), t) for txs in per_round for t in txs]
+
+        # Newest first: once we reach an already-seen txn, the rest are older still
+        stamped.sort(key=itemgetter(0), reverse=True)
+        newest = max(last_seen, stamped[0][0]) if stamped else last_seen
+
+        # Only new + final
+        new_txs: List[Tuple[int, Dict[str, Any]]] = []
+
+        # The _FINAL check stays inline: this runs once per unseen transaction.
+        # A waiver run finalises a batch of claims in the same millisecond, so
+        # the watermark is inclusive and ties are settled by transaction id.
+        for ts, t in stamped:
+            if ts < last_seen or not ts:
+                break
+            if ts == last_seen and (seen_ids is None or str(t.get("transaction_id")) in seen_ids):
+                continue
+            if (t.get("status") or "").lower() in _FINAL:
+                new_txs.append((ts, t))
+        state["last_seen_ids"] = sorted(
+            str(t.get("transaction_id"))
+            for ts, t in takewhile(lambda st: st[0] == newest, stamped)
+            if ts and (t.get("status") or "").lower() in _FINAL
+        )
+
+        # Most runs find nothing new and never need names. Otherwise load them
+        # before state advances, so a failed lookup retries these receipts.
+        rmap: Dict[int, str] = {}
+        pmap: Dict[str, str] = {}
+        rid_index: Dict[int, int] = {}
+        if new_txs:
+            # Only players in receipts we're about to post ever get printed
+            needed_pids = {pid for _, t in new_txs for key in ("adds", "drops") for pid in (t.get(key) or {})}
+            players_path, (rmap, user_to_rid) = await asyncio.gather(
+                _refresh_cache(client, PLAYERS_URL, PLAYERS_TTL_S),
+                roster_name_map(client),
+            )
+            pmap = player_name_map(players_path, needed_pids)
+
+            # roster_ids (1..N) and user_ids (snowflakes) never collide, so one dict
+            # resolves either; roster_ids win just in case
+            rid_index = {**user_to_rid, **{rid: rid for rid in rmap}}
+
+        # Advance state first (prevents replay if message posting fails mid-run)
+        if (
+            newest > last_seen
+            or last_txn_id != prev_txn_id
+            or state["last_seen_ids"] != prev_seen_ids
+        ):
+            state["last_seen_ms"] = newest
+            save_state(state)
+
+        if not new_txs:
+            return
+
+        # Post oldest-first. A stable sort keeps same-millisecond txns in
+        # Sleeper's order, which reverse() would flip.
+        new_txs.sort(key=itemgetter(0))
+
+        waiver_lines: List[str] = []
+        trade_lines: List[str] = []
+
+        for _, t in new_txs:
+            ttype = (t.get("type") or "").lower()
+
+            if ttype in ("waiver", "free_agent", "add_drop"):
+                block = format_waiver_receipt(t, rmap, pmap)
+                if block:
+                    if waiver_lines:
+                        waiver_lines.append("")  # spacer between receipts
+                    waiver_lines.extend(block)
+
+            elif ttype == "trade":
+                block = format_trade_receipt(t, rmap, pmap, rid_index)
+                if block:
+                    if trade_lines:
+                        trade_lines.append("")
+                    trade_lines.extend(block)
+
+        outbox = [
+            (WEBHOOK_WAIVERS, build_messages(waiver_lines, _WAIVER_COLOR)),
+            (WEBHOOK_TRADES, build_messages(trade_lines, _TRADE_COLOR)),
+        ]
+
+        # Different webhooks have separate rate limits, so they can post side by side
+        locks = {webhook: asyncio.Lock() for webhook, _ in outbox}
+        await asyncio.gather(*(post_all(client, webhook, msgs, locks[webhook]) for webhook, msgs in outbox if msgs))
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
@@ -0,0 +1,115 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SLEEPER_LEAGUE_ID", "L1")
+os.environ.setdefault("DISCORD_WEBHOOK_WAIVERS", "https://discord.test/api/webhooks/W")
+os.environ.setdefault("DISCORD_WEBHOOK_TRADES", "https://discord.test/api/webhooks/T")
+
+import ledger  # noqa: E402
+
+DAY_MS = 24 * 60 * 60 * 1000
+T = 100 * DAY_MS
+
+
+class FakeLeague:
+    # Serves Sleeper from in-memory rounds and records Discord posts
+    def __init__(self):
+        self.rounds = {r: [] for r in ledger.ROUNDS}
+        self.last_txn_id = ""
+        self.posts = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        url = str(request.url)
+        if request.method == "POST":
+            self.posts.append((url.rsplit("/", 1)[1], json.loads(request.content)))
+            return httpx.Response(204)
+        if url == ledger.LEAGUE_URL:
+            return httpx.Response(200, json={"last_transaction_id": self.last_txn_id})
+        if url.startswith(f"{ledger.LEAGUE_URL}/transactions/"):
+            return httpx.Response(200, json=self.rounds[int(url.rsplit("/", 1)[1])])
+        if url == f"{ledger.LEAGUE_URL}/rosters":
+            return httpx.Response(200, json=[
+                {"roster_id": 1, "owner_id": "11", "metadata": {"team_name": "Alice FC"}},
+                {"roster_id": 2, "owner_id": "22", "metadata": {"team_name": "Bob FC"}},
+            ])
+        if url == ledger.PLAYERS_URL:
+            return httpx.Response(200, json={
+                "p1": {"full_name": "Joe Burrow", "position": "QB", "team": "CIN"},
+                "p2": {"full_name": "Travis Kelce", "position": "TE", "team": "KC"},
+                "p3": {"full_name": "Tyreek Hill", "position": "WR", "team": "MIA"},
+            })
+        return httpx.Response(404)
+
+    def run(self):
+        posts_before = len(self.posts)
+        def client() -> httpx.AsyncClient:
+            return httpx.AsyncClient(transport=httpx.MockTransport(self.handler))
+
+        orig, ledger._new_client = ledger._new_client, client
+        try:
+            asyncio.run(ledger.main())
+        finally:
+            ledger._new_client = orig
+        return self.posts[posts_before:]
+
+
+def waiver(txn_id, ts, pid, rid):
+    return {"transaction_id": txn_id, "type": "waiver", "status": "complete",
+            "status_updated": ts, "created": ts, "adds": {pid: rid}, "roster_ids": [rid]}
+
+
+class LedgerTest(unittest.TestCase):
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.TemporaryDirectory()
+        os.chdir(self._tmp.name)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
+
+    def test_trade_finalising_in_quiet_round_is_posted(self):
+        league = FakeLeague()
+        proposed = T - 10 * DAY_MS
+        trade = {"transaction_id": "1", "type": "trade", "status": "pending",
+                 "status_updated": proposed, "created": proposed,
+                 "adds": {"p2": 2, "p3": 1}, "roster_ids": [1, 2]}
+        league.rounds[0] = [trade]
+        league.rounds[1] = [waiver("2", T - 60 * 60 * 1000, "p1", 1)]
+        league.last_txn_id = "2"
+        posts = league.run()
+        self.assertEqual([hook for hook, _ in posts], ["W"])
+
+        # The round-0 trade completes, then a newer waiver lands in round 1
+        league.rounds[0] = [dict(trade, status="complete", status_updated=T)]
+        league.rounds[1].append(waiver("3", T + 1000, "p1", 2))
+        league.last_txn_id = "3"
+        posts = league.run()
+        self.assertEqual(sorted(hook for hook, _ in posts), ["T", "W"])
+        trade_desc = next(body for hook, body in posts if hook == "T")["embeds"][0]["description"]
+        self.assertIn("Travis Kelce", trade_desc)
+
+    def test_throttled_refresh_serves_stale_copy(self):
+        statuses = [200, 429]
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(statuses.pop(0), json=[{"roster_id": 1}])
+
+        async def fetch_twice():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+                url = f"{ledger.LEAGUE_URL}/rosters"
+                await ledger._cached_get(client, url, 0)
+                return await ledger._cached_get(client, url, 0)
+
+        self.assertEqual(asyncio.run(fetch_twice()), [{"roster_id": 1}])
+
+
+if __name__ == "__main__":
+    unittest.main()